@@ -1,230 +1,240 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy import select, text
+import time
+
+from fastapi import APIRouter, HTTPException, Depends, Response
+from pydantic import TypeAdapter
+from sqlalchemy import bindparam, cast, delete, func, insert, literal, select, text, update
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
 from app.core.database import get_db
+from app.core.notifications import TASK_READY_CHANNEL, task_ready_listener
 from app.db.models import Suggestion, Task, TaskStatusEnum
 from app.schemas import (
     SuggestionResponse,
     TaskApproveRequest,
     TaskResponse,
-    DispatchRequest
+    DispatchRequest,
+    DispatchBatchRequest
 )
 
 router = APIRouter()
 
 
-STATUS_CRITICAL_EMPTY_THRESHOLD = 0.10
-STATUS_WARNING_EMPTY_THRESHOLD = 0.20
-STATUS_CRITICAL_FULL_THRESHOLD = 0.90
-STATUS_WARNING_FULL_THRESHOLD = 0.80
+_SUGGESTION_LIST = TypeAdapter(list[SuggestionResponse])
+_TASK_LIST = TypeAdapter(list[TaskResponse])
+
+# Hot-path statements are built once at import so each request reuses the
+# same construct (and its entry in the engine's compiled cache).
+_tasks = Task.__table__
+_suggestions = Suggestion.__table__
+
+_SUGGESTIONS_TS_STMT = text("SELECT MAX(ts) FROM station_suggestions_cards")
 
+_SUGGESTIONS_STMT = text(
+    """
+    SELECT id, name, lat, lng, capacity, available, status, type
+    FROM station_suggestions_cards
+    ORDER BY id;
+    """
+)
+
+_deleted_suggestion = (
+    delete(_suggestions)
+    .where(_suggestions.c.id == bindparam("suggestion_id"))
+    .returning(
+        _suggestions.c.from_station_id,
+        _suggestions.c.to_station_id,
+        _suggestions.c.qty,
+        _suggestions.c.reason,
+    )
+    .cte("deleted_suggestion")
+)
+_APPROVE_STMT = (
+    insert(_tasks)
+    .from_select(
+        ["from_station_id", "to_station_id", "qty", "reason", "status", "created_at"],
+        select(
+            _deleted_suggestion.c.from_station_id,
+            _deleted_suggestion.c.to_station_id,
+            _deleted_suggestion.c.qty,
+            _deleted_suggestion.c.reason,
+            cast(literal(TaskStatusEnum.READY, _tasks.c.status.type), _tasks.c.status.type),
+            func.timezone("utc", func.now()),
+        ),
+    )
+    .returning(*_tasks.c)
+)
+
+_next_ready_task_ids = (
+    select(_tasks.c.id)
+    .where(_tasks.c.status == TaskStatusEnum.READY)
+    .order_by(_tasks.c.created_at.asc())
+    .with_for_update(skip_locked=True)
+    .limit(bindparam("count"))
+)
+_DISPATCH_STMT = (
+    update(_tasks)
+    .where(_tasks.c.id.in_(_next_ready_task_ids))
+    .values(status=TaskStatusEnum.ASSIGNED, worker_id=bindparam("worker_id"))
+    .returning(*_tasks.c)
+)
 
-def _derive_status_and_type(capacity: int | None, available: int | None) -> tuple[str, str]:
-    """Classify station based on available bikes vs capacity."""
-    capacity = capacity or 0
-    available = available or 0
+_NOTIFY_TASK_READY_STMT = text(f"NOTIFY {TASK_READY_CHANNEL}")
 
-    if capacity <= 0:
-        return "balanced", "null"
+_COMPLETE_STMT = (
+    update(_tasks)
+    .where(_tasks.c.id == bindparam("task_id"))
+    .values(status=TaskStatusEnum.COMPLETED)
+    .returning(*_tasks.c)
+)
 
-    ratio = available / capacity
+# (latest snapshot ts, monotonic expiry, serialized JSON body) of the last /suggestions response
+_suggestions_cache: tuple = (None, 0.0, b"")
 
-    if ratio <= STATUS_CRITICAL_EMPTY_THRESHOLD:
-        return "critical", "empty"
-    if ratio >= STATUS_CRITICAL_FULL_THRESHOLD:
-        return "critical", "full"
-    if ratio <= STATUS_WARNING_EMPTY_THRESHOLD:
-        return "warning", "empty"
-    if ratio >= STATUS_WARNING_FULL_THRESHOLD:
-        return "warning", "full"
 
-    return "balanced", "null"
+def _task_response(row) -> Response:
+    """Serialize a RETURNING row from backend_tasks without re-validating it."""
+    task = TaskResponse.model_construct(**row._mapping)
+    return Response(content=task.model_dump_json(), media_type="application/json")
 
 
 @router.get("/suggestions", response_model=list[SuggestionResponse])
-async def get_suggestions(db: Session = Depends(get_db)):
+def get_suggestions(db: Session = Depends(get_db)):
     """
-    Return station status cards computed from stations + latest station_status snapshot.
+    Return station status cards from the station_suggestions_cards materialized view.
+
+    The serialized payload is cached in-process and reused until the latest snapshot
+    timestamp changes or SUGGESTIONS_CACHE_TTL expires.
     """
-    try:
-        stmt = text(
-            """
-            WITH latest_status AS (
-                SELECT DISTINCT ON (station_id)
-                       station_id,
-                       num_bikes_available,
-                       ts
-                FROM station_status
-                ORDER BY station_id, ts DESC
-            )
-            SELECT
-                s.station_id AS id,
-                s.name,
-                s.lat,
-                s.lon AS lng,
-                COALESCE(s.capacity, 0) AS capacity,
-                COALESCE(ls.num_bikes_available, 0) AS available
-            FROM stations s
-            LEFT JOIN latest_status ls
-                   ON ls.station_id = s.station_id
-            ORDER BY s.station_id;
-            """
-        )
-        result = db.execute(stmt).mappings().all()
-
-        suggestions = []
-        for row in result:
-            status, type_ = _derive_status_and_type(row["capacity"], row["available"])
-            payload = {
-                "id": str(row["id"]),
-                "name": row["name"],
-                "lat": row["lat"],
-                "lng": row["lng"],
-                "capacity": row["capacity"] or 0,
-                "available": row["available"] or 0,
-                "status": status,
-                "type": type_,
-            }
-            suggestions.append(SuggestionResponse.model_validate(payload))
-
-        return suggestions
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching suggestions: {str(e)}")
+    global _suggestions_cache
+    latest_ts = db.execute(_SUGGESTIONS_TS_STMT).scalar()
+    cached_ts, expires_at, body = _suggestions_cache
+    if cached_ts == latest_ts and time.monotonic() < expires_at:
+        return Response(content=body, media_type="application/json")
+
+    rows = db.execute(_SUGGESTIONS_STMT).mappings().fetchall()
+
+    # Validate the whole list in one pydantic-core call rather than per row
+    suggestions = _SUGGESTION_LIST.validate_python([dict(row) for row in rows])
+
+    body = _SUGGESTION_LIST.dump_json(suggestions)
+    _suggestions_cache = (latest_ts, time.monotonic() + settings.SUGGESTIONS_CACHE_TTL, body)
+    return Response(content=body, media_type="application/json")
 
 
 @router.post("/task/approve", response_model=TaskResponse)
-async def approve_task(request: TaskApproveRequest, db: Session = Depends(get_db)):
+def approve_task(request: TaskApproveRequest, db: Session = Depends(get_db)):
     """
     Approve a suggestion and create a task.
     
-    Logic:
-    1. Find the Suggestion by ID
-    2. Create a new Task row with data from Suggestion (status='ready')
-    3. Delete the Suggestion row
+    Logic (one statement, one round-trip):
+    1. Delete the Suggestion by ID, returning its data
+    2. Insert a new Task row from the returned data (status='ready')
+    3. Return the inserted Task via RETURNING
     4. Commit transaction
     """
-    try:
-        # Find the suggestion
-        suggestion = db.query(Suggestion).filter(Suggestion.id == request.suggestion_id).first()
-        
-        if not suggestion:
-            raise HTTPException(status_code=404, detail=f"Suggestion with id {request.suggestion_id} not found")
-        
-        # Create a new task from the suggestion
-        task = Task(
-            from_station_id=suggestion.from_station_id,
-            to_station_id=suggestion.to_station_id,
-            qty=suggestion.qty,
-            reason=suggestion.reason,
-            status=TaskStatusEnum.READY
-        )
-        
-        # Add task to session
-        db.add(task)
-        
-        # Delete the suggestion
-        db.delete(suggestion)
-        
-        # Commit the transaction
-        db.commit()
-        
-        # Refresh to get the generated ID
-        db.refresh(task)
-        
-        return TaskResponse.model_validate(task)
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Error approving task: {str(e)}")
+    task = db.execute(_APPROVE_STMT, {"suggestion_id": request.suggestion_id}).first()
+
+    if task is None:
+        raise HTTPException(status_code=404, detail=f"Suggestion with id {request.suggestion_id} not found")
+
+    # Wake long-polling dispatchers; delivered by Postgres on commit
+    db.execute(_NOTIFY_TASK_READY_STMT)
+
+    # Commit the transaction
+    db.commit()
+
+    return _task_response(task)
 
 
 @router.post("/dispatch/next", response_model=TaskResponse)
-async def dispatch_next_task(request: DispatchRequest, db: Session = Depends(get_db)):
+def dispatch_next_task(request: DispatchRequest, db: Session = Depends(get_db)):
     """
     Dispatch the next available task to a worker.
     
     CRITICAL: Uses row-level locking to prevent race conditions.
     
-    Logic:
+    Logic (one statement, one round-trip):
     1. Find the oldest Task where status='ready'
     2. Use SELECT ... FOR UPDATE SKIP LOCKED to ensure exclusive access
     3. Update that task to status='assigned' and set worker_id
-    4. Return the Task
+    4. Return the Task via RETURNING
     
     This ensures that even if multiple workers request simultaneously,
     each will get a different task.
+
+    When the queue is empty the request long-polls: it waits up to
+    DISPATCH_LONG_POLL_TIMEOUT seconds for a task_ready NOTIFY from
+    approve_task and retries the claim once before returning 404.
     """
-    try:
-        # Use SELECT ... FOR UPDATE SKIP LOCKED for concurrency safety
-        # This ensures that if two workers request simultaneously, they get different tasks
-        stmt = (
-            select(Task)
-            .where(Task.status == TaskStatusEnum.READY)
-            .order_by(Task.created_at.asc())
-            .with_for_update(skip_locked=True)
-            .limit(1)
-        )
-        
-        result = db.execute(stmt)
-        task = result.scalar_one_or_none()
-        
-        if not task:
-            raise HTTPException(
-                status_code=404,
-                detail="No available tasks with status 'ready'"
-            )
-        
-        # Update the task
-        task.status = TaskStatusEnum.ASSIGNED
-        task.worker_id = request.worker_id
-        
-        # Commit the transaction
-        db.commit()
-        
-        # Refresh to ensure we have the latest state
-        db.refresh(task)
-        
-        return TaskResponse.model_validate(task)
-        
-    except HTTPException:
-        raise
-    except Exception as e:
+    params = {"worker_id": request.worker_id, "count": 1}
+    long_poll = settings.DISPATCH_LONG_POLL_TIMEOUT > 0
+    # Taken before querying so a NOTIFY racing the empty claim is not lost
+    generation = task_ready_listener.mark() if long_poll else None
+
+    # Use SELECT ... FOR UPDATE SKIP LOCKED for concurrency safety
+    # This ensures that if two workers request simultaneously, they get different tasks
+    task = db.execute(_DISPATCH_STMT, params).first()
+
+    if task is None and long_poll:
+        # Release the connection while idle, then retry once when a task is approved
         db.rollback()
-        raise HTTPException(status_code=500, detail=f"Error dispatching task: {str(e)}")
+        if task_ready_listener.wait(generation, settings.DISPATCH_LONG_POLL_TIMEOUT):
+            task = db.execute(_DISPATCH_STMT, params).first()
+
+    if task is None:
+        raise HTTPException(
+            status_code=404,
+            detail="No available tasks with status 'ready'"
+        )
+
+    # Commit the transaction
+    db.commit()
+
+    return _task_response(task)
+
+
+@router.post("/dispatch/batch", response_model=list[TaskResponse])
+def dispatch_task_batch(request: DispatchBatchRequest, db: Session = Depends(get_db)):
+    """
+    Dispatch up to `count` ready tasks to a single worker in one transaction.
+
+    Uses the same FOR UPDATE SKIP LOCKED claim as /dispatch/next, so concurrent
+    batches never overlap. Tasks are returned oldest first.
+    """
+    rows = db.execute(
+        _DISPATCH_STMT, {"worker_id": request.worker_id, "count": request.count}
+    ).fetchall()
+
+    if not rows:
+        raise HTTPException(
+            status_code=404,
+            detail="No available tasks with status 'ready'"
+        )
+
+    # Commit the transaction
+    db.commit()
+
+    rows.sort(key=lambda row: (row.created_at, row.id))
+    tasks = [TaskResponse.model_construct(**row._mapping) for row in rows]
+    return Response(content=_TASK_LIST.dump_json(tasks), media_type="application/json")
 
 
 @router.post("/task/{task_id}/complete", response_model=TaskResponse)
-async def complete_task(task_id: int, db: Session = Depends(get_db)):
+def complete_task(task_id: int, db: Session = Depends(get_db)):
     """
     Mark a task as completed.
     
-    Updates the task status to 'completed'.
+    Updates the task status to 'completed' with a single UPDATE ... RETURNING.
     """
-    try:
-        # Find the task
-        task = db.query(Task).filter(Task.id == task_id).first()
-        
-        if not task:
-            raise HTTPException(status_code=404, detail=f"Task with id {task_id} not found")
-        
-        # Update status to completed
-        task.status = TaskStatusEnum.COMPLETED
-        
-        # Commit the transaction
-        db.commit()
-        
-        # Refresh to ensure we have the latest state
-        db.refresh(task)
-        
-        return TaskResponse.model_validate(task)
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Error completing task: {str(e)}")
+    task = db.execute(_COMPLETE_STMT, {"task_id": task_id}).first()
+
+    if task is None:
+        raise HTTPException(status_code=404, detail=f"Task with id {task_id} not found")
+
+    # Commit the transaction
+    db.commit()
+
+    return _task_response(task)
 
 
@@ -10,7 +10,26 @@ class Settings(BaseSettings):
         "DATABASE_URL",
         "postgresql://postgres:postgres@db:5432/baywheels"
     )
+
+    # Connection pool (per uvicorn worker). Keep
+    # (DB_POOL_SIZE + DB_MAX_OVERFLOW) * workers below Postgres max_connections.
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    # Set when DATABASE_URL points at PgBouncer, which does the pooling itself
+    DB_USE_NULL_POOL: bool = False
     
+    # Seconds a GET /suggestions payload may be reused while MAX(ts) of station_suggestions_cards is unchanged
+    SUGGESTIONS_CACHE_TTL: int = 30
+    # Seconds between background refreshes of the GET /suggestions materialized views (0 disables)
+    STATION_VIEWS_REFRESH_INTERVAL: float = 30.0
+
+    # Seconds an empty POST /dispatch/next waits for a task_ready NOTIFY (0 disables)
+    DISPATCH_LONG_POLL_TIMEOUT: float = 25.0
+    # Concurrent long-polls allowed per worker process; extra requests get 404 immediately
+    DISPATCH_LONG_POLL_MAX_WAITERS: int = 10
+
     # API
     API_TITLE: str = "Bay Wheels Orchestration & Dispatch Service"
     API_VERSION: str = "1.0.0"
@@ -1,27 +1,45 @@
 from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
 from sqlalchemy.orm import sessionmaker, Session
 from typing import Generator
 
 from app.core.config import settings
 from app.db.base import Base
+from app.db.views import ensure_station_views
 
 # Create database engine
-engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True)
+if settings.DB_USE_NULL_POOL:
+    engine = create_engine(settings.DATABASE_URL, poolclass=NullPool, pool_pre_ping=True, query_cache_size=1200)
+else:
+    engine = create_engine(
+        settings.DATABASE_URL,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+        query_cache_size=1200,
+    )
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
 def init_db():
-    """Initialize database - create all tables"""
+    """Initialize database - create all tables, and the station views if the GBFS tables exist"""
     Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        ensure_station_views(conn)
 
 
 def get_db() -> Generator[Session, None, None]:
-    """Dependency to get database session"""
+    """Dependency to get database session; rolls back if the request fails"""
     db = SessionLocal()
     try:
         yield db
+    except Exception:
+        db.rollback()
+        raise
     finally:
         db.close()
 
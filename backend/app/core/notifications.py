@@ -0,0 +1,92 @@
+import logging
+import select
+import threading
+import time
+
+from app.core.config import settings
+from app.core.database import engine
+
+LOG = logging.getLogger(__name__)
+
+TASK_READY_CHANNEL = "task_ready"
+
+
+class ChannelListener:
+    """
+    Shared Postgres LISTEN connection for one NOTIFY channel.
+
+    A single daemon thread owns the LISTEN connection and bumps a generation
+    counter on every notification; request threads block on a condition until
+    the counter moves past the value they saw before querying. This keeps idle
+    long-polls off the database entirely.
+    """
+
+    def __init__(self, channel: str, max_waiters: int):
+        self.channel = channel
+        self._cond = threading.Condition()
+        self._generation = 0
+        self._waiters = threading.BoundedSemaphore(max_waiters)
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+
+    def mark(self) -> int:
+        """Start listening if needed and return the current notification generation."""
+        self._ensure_started()
+        with self._cond:
+            return self._generation
+
+    def wait(self, since: int, timeout: float) -> bool:
+        """
+        Block until a notification newer than `since` arrives or `timeout` elapses.
+
+        Returns False immediately when too many requests are already waiting,
+        so long-polls can never exhaust the request threadpool.
+        """
+        if not self._waiters.acquire(blocking=False):
+            return False
+        try:
+            with self._cond:
+                return self._cond.wait_for(lambda: self._generation != since, timeout)
+        finally:
+            self._waiters.release()
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name=f"listen-{self.channel}", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self._listen()
+            except Exception:
+                LOG.exception("LISTEN %s connection lost, reconnecting", self.channel)
+                time.sleep(1)
+
+    def _listen(self):
+        # Detached so the long-lived connection does not count against the request pool
+        conn = engine.raw_connection()
+        dbapi_conn = conn.driver_connection
+        conn.detach()
+        try:
+            dbapi_conn.autocommit = True
+            with dbapi_conn.cursor() as cur:
+                cur.execute(f"LISTEN {self.channel}")
+
+            while True:
+                if select.select([dbapi_conn], [], [], 5.0) == ([], [], []):
+                    continue
+                dbapi_conn.poll()
+                if dbapi_conn.notifies:
+                    dbapi_conn.notifies.clear()
+                    with self._cond:
+                        self._generation += 1
+                        self._cond.notify_all()
+        finally:
+            conn.close()
+
+
+task_ready_listener = ChannelListener(TASK_READY_CHANNEL, settings.DISPATCH_LONG_POLL_MAX_WAITERS)
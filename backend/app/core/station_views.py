@@ -0,0 +1,57 @@
+import logging
+import threading
+import time
+
+from app.core.config import settings
+from app.core.database import engine
+from app.db.views import ensure_station_views, refresh_station_views
+
+LOG = logging.getLogger(__name__)
+
+
+class StationViewRefresher:
+    """
+    Background refresh of the GET /suggestions materialized views.
+
+    A single daemon thread per worker process creates the views once the GBFS
+    tables exist and then refreshes them every `interval` seconds. The refresh
+    takes a Postgres advisory lock, so with several uvicorn workers only one of
+    them refreshes per round.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._ready = False
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Start the refresh thread unless disabled (`interval <= 0`) or already running."""
+        if self.interval <= 0:
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="station-views-refresh", daemon=True
+                )
+                self._thread.start()
+
+    def refresh_once(self):
+        """Create the views if needed, then refresh them; one transaction."""
+        with engine.begin() as conn:
+            if not self._ready:
+                self._ready = ensure_station_views(conn)
+                if not self._ready:
+                    return
+            refresh_station_views(conn)
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh_once()
+            except Exception:
+                LOG.exception("Station view refresh failed")
+            time.sleep(self.interval)
+
+
+station_view_refresher = StationViewRefresher(settings.STATION_VIEWS_REFRESH_INTERVAL)
@@ -1,9 +1,11 @@
-from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, DateTime, Enum as SQLEnum, Index, text
 import enum
 
 from app.db.base import Base
 
+# Naive UTC timestamp filled in by Postgres, matching the old datetime.utcnow values
+_UTC_NOW = text("timezone('utc', now())")
+
 
 class TaskStatusEnum(str, enum.Enum):
     """Task status enumeration for database"""
@@ -21,7 +23,7 @@ class Suggestion(Base):
     to_station_id = Column(Integer, nullable=False)
     qty = Column(Integer, nullable=False)
     reason = Column(String, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    created_at = Column(DateTime, server_default=_UTC_NOW, nullable=False)
 
 
 class Task(Base):
@@ -35,6 +37,13 @@ class Task(Base):
     reason = Column(String, nullable=True)
     status = Column(SQLEnum(TaskStatusEnum), default=TaskStatusEnum.READY, nullable=False)
     worker_id = Column(String, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-
-
+    created_at = Column(DateTime, server_default=_UTC_NOW, nullable=False)
+
+    __table_args__ = (
+        # Partial index keeps the dispatch queue scan limited to ready tasks
+        Index(
+            "ix_backend_tasks_ready_created_at",
+            created_at,
+            postgresql_where=(status == TaskStatusEnum.READY),
+        ),
+    )
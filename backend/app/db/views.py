@@ -0,0 +1,132 @@
+from sqlalchemy import text
+
+# GET /suggestions read models over the GBFS tables (`stations`, `station_status`).
+# The GBFS poller owns those tables, so the views are created here once they exist
+# instead of by Base.metadata.create_all. To change a definition, drop both views;
+# the backend recreates them on its next startup or refresh round.
+
+# Refresh order matters: later views read from earlier ones
+STATION_VIEWS = (
+    "station_status_latest",
+    "station_suggestions_cards",
+)
+
+# Serializes view creation and refreshes across uvicorn worker processes
+STATION_VIEWS_LOCK_KEY = 7310402
+
+STATION_VIEWS_DDL = (
+    # Covering indexes so the view refreshes below are served by index-only scans
+    # (DISTINCT ON walks station_status in (station_id, ts DESC) order; the latest-status join reads stations by station_id)
+    """
+    CREATE INDEX IF NOT EXISTS idx_station_status_station_ts_covering
+        ON station_status (station_id, ts DESC) INCLUDE (num_bikes_available)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_stations_covering
+        ON stations (station_id) INCLUDE (name, lat, lon, capacity)
+    """,
+    # Latest snapshot per station, denormalized with the station attributes the API reads,
+    # so GET /suggestions never joins stations at request time.
+    # Stations without any status row are kept with NULL num_bikes_available / ts.
+    """
+    CREATE MATERIALIZED VIEW IF NOT EXISTS station_status_latest AS
+    SELECT
+        s.station_id,
+        s.name,
+        s.lat,
+        s.lon,
+        s.capacity,
+        ls.num_bikes_available,
+        ls.ts
+    FROM stations s
+    LEFT JOIN (
+        SELECT DISTINCT ON (station_id)
+               station_id,
+               num_bikes_available,
+               ts
+        FROM station_status
+        ORDER BY station_id, ts DESC
+    ) ls ON ls.station_id = s.station_id
+    """,
+    # Unique index is required for REFRESH MATERIALIZED VIEW CONCURRENTLY
+    """
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_station_status_latest_station_id
+        ON station_status_latest (station_id)
+    """,
+    # Fully-formed GET /suggestions cards: inventory plus urgency tier from ratio = available / capacity
+    #   capacity <= 0            -> balanced / null
+    #   ratio <= 0.10 or >= 0.90 -> critical / empty|full
+    #   ratio <= 0.20 or >= 0.80 -> warning  / empty|full
+    #   otherwise                -> balanced / null
+    """
+    CREATE MATERIALIZED VIEW IF NOT EXISTS station_suggestions_cards AS
+    WITH cards AS (
+        SELECT
+            station_id::text AS id,
+            name,
+            lat::float8 AS lat,
+            lon::float8 AS lng,
+            COALESCE(capacity, 0) AS capacity,
+            COALESCE(num_bikes_available, 0) AS available,
+            ts
+        FROM station_status_latest
+    ), ratios AS (
+        SELECT *, available::float / NULLIF(capacity, 0) AS ratio
+        FROM cards
+    )
+    SELECT
+        id, name, lat, lng, capacity, available, ts,
+        CASE
+            WHEN capacity <= 0 THEN 'balanced'
+            WHEN ratio <= 0.10 OR ratio >= 0.90 THEN 'critical'
+            WHEN ratio <= 0.20 OR ratio >= 0.80 THEN 'warning'
+            ELSE 'balanced'
+        END AS status,
+        CASE
+            WHEN capacity <= 0 THEN 'null'
+            WHEN ratio <= 0.10 THEN 'empty'
+            WHEN ratio >= 0.90 THEN 'full'
+            WHEN ratio <= 0.20 THEN 'empty'
+            WHEN ratio >= 0.80 THEN 'full'
+            ELSE 'null'
+        END AS type
+    FROM ratios
+    """,
+    """
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_station_suggestions_cards_id
+        ON station_suggestions_cards (id)
+    """,
+)
+
+_LOCK_STMT = text("SELECT pg_advisory_xact_lock(:key)")
+_TRY_LOCK_STMT = text("SELECT pg_try_advisory_xact_lock(:key)")
+_SOURCE_TABLES_STMT = text("SELECT to_regclass('stations') IS NOT NULL AND to_regclass('station_status') IS NOT NULL")
+
+
+def ensure_station_views(conn) -> bool:
+    """
+    Create the station read models if they are missing.
+
+    Returns False without creating anything while the GBFS poller has not yet
+    created its source tables. Run inside a transaction.
+    """
+    if not conn.execute(_SOURCE_TABLES_STMT).scalar():
+        return False
+    conn.execute(_LOCK_STMT, {"key": STATION_VIEWS_LOCK_KEY})
+    for ddl in STATION_VIEWS_DDL:
+        conn.exec_driver_sql(ddl)
+    return True
+
+
+def refresh_station_views(conn) -> bool:
+    """
+    Refresh the station read models without blocking concurrent readers.
+
+    Returns False, skipping the round, when another process holds the views lock.
+    Run inside a transaction.
+    """
+    if not conn.execute(_TRY_LOCK_STMT, {"key": STATION_VIEWS_LOCK_KEY}).scalar():
+        return False
+    for view in STATION_VIEWS:
+        conn.exec_driver_sql(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}")
+    return True
@@ -1,22 +1,47 @@
-from fastapi import FastAPI
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.exc import SQLAlchemyError
 
 from app.core.config import settings
 from app.core.database import init_db
+from app.core.station_views import station_view_refresher
 from app.api.routes import router
 
+LOG = logging.getLogger(__name__)
+
 # Initialize database
 init_db()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Keep the GET /suggestions materialized views current while the app runs"""
+    station_view_refresher.start()
+    yield
+
+
 # Create FastAPI app
 app = FastAPI(
     title=settings.API_TITLE,
-    version=settings.API_VERSION
+    version=settings.API_VERSION,
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # Include routers
 app.include_router(router)
 
 
+@app.exception_handler(SQLAlchemyError)
+async def database_error_handler(request: Request, exc: SQLAlchemyError):
+    """Single 500 path for database failures; the session dependency rolls back"""
+    LOG.exception("Database error on %s %s", request.method, request.url.path, exc_info=exc)
+    return ORJSONResponse(status_code=500, content={"detail": "Database error"})
+
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
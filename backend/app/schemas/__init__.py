@@ -1,19 +1,25 @@
 from app.schemas.schemas import (
     TaskStatus,
+    StationStatus,
+    StationStateType,
     SuggestionResponse,
     TaskCreate,
     TaskApproveRequest,
     DispatchRequest,
+    DispatchBatchRequest,
     TaskResponse,
     TaskCompleteRequest
 )
 
 __all__ = [
     "TaskStatus",
+    "StationStatus",
+    "StationStateType",
     "SuggestionResponse",
     "TaskCreate",
     "TaskApproveRequest",
     "DispatchRequest",
+    "DispatchBatchRequest",
     "TaskResponse",
     "TaskCompleteRequest"
 ]
@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Optional
 from enum import Enum
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class TaskStatus(str, Enum):
@@ -58,6 +58,11 @@ class DispatchRequest(BaseModel):
     worker_id: str
 
 
+class DispatchBatchRequest(DispatchRequest):
+    """Input schema for claiming several ready tasks for one worker at once"""
+    count: int = Field(default=10, ge=1, le=100)
+
+
 class TaskResponse(BaseModel):
     """Response schema for a task"""
     id: int
@@ -7,6 +7,8 @@ Logical steps:
 4. Aggregate: count departures and arrivals per bucket.
 5. Compute historical averages: avg_arrivals_15m, avg_departures_15m, avg_net_flow_15m.
 6. Upsert into station_15min_demand table.
+7. Refresh the forecast fallback tiers (mv_demand_dh, mv_demand_hq, mv_demand_stn).
+8. Bump demand_version so run_forecast.py recomputes forecasts built from the previous data.
 
 Configuration: uses `.env` or environment variables. No CLI args.
 
@@ -15,29 +17,34 @@ Env vars supported:
 """
 
 import logging
-import os
 
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from dotenv import load_dotenv
 
+from common import get_engine
+
 LOG = logging.getLogger("build_station_flow_15min")
 
+# Materialized fallback tiers over station_15min_demand (defined in db/sql/schema.sql)
+DEMAND_VIEWS = (
+    "mv_demand_dh",
+    "mv_demand_hq",
+    "mv_demand_stn",
+)
 
-def build_db_url_from_env():
-    user = os.environ.get('POSTGRES_USER', os.environ.get('DB_USER', 'postgres'))
-    pwd = os.environ.get('POSTGRES_PASSWORD', os.environ.get('DB_PASSWORD', 'postgres'))
-    host = os.environ.get('POSTGRES_HOST', os.environ.get('DB_HOST', 'localhost'))
-    port = os.environ.get('DB_PORT', '5432')
-    db = os.environ.get('POSTGRES_DB', os.environ.get('DB_NAME', 'baywheels'))
-    return f"postgresql://{user}:{pwd}@{host}:{port}/{db}"
+# Invalidates every stored forecast: run_forecast.py recomputes stations whose demand_version is older
+BUMP_DEMAND_VERSION_SQL = text(
+    "INSERT INTO demand_version (singleton, version) VALUES (true, 1) "
+    "ON CONFLICT (singleton) DO UPDATE SET version = demand_version.version + 1, built_at = now() "
+    "RETURNING version"
+)
 
 
 def main():
     logging.basicConfig(level=logging.INFO)
     load_dotenv()
 
-    db_url = os.environ.get('DATABASE_URL') or build_db_url_from_env()
-    engine = create_engine(db_url)
+    engine = get_engine()
 
     # SQL to compute historical demand patterns
     # Step 1: Extract departures by (station_id, day_of_week, hour_of_day, quarter_hour)
@@ -100,6 +107,12 @@ def main():
         LOG.info("Building historical demand patterns from trip_history...")
         conn.execute(aggregation_sql)
         LOG.info("Demand patterns successfully written to station_15min_demand")
+        for view in DEMAND_VIEWS:
+            conn.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}"))
+        LOG.info("Refreshed demand fallback views: %s", ", ".join(DEMAND_VIEWS))
+        # Same transaction: run_forecast.py sees the new version only together with the new demand data
+        version = conn.execute(BUMP_DEMAND_VERSION_SQL).scalar()
+        LOG.info("Demand version is now %d; run_forecast.py will recompute every station", version)
 
 
 if __name__ == '__main__':
@@ -1,54 +1,82 @@
 """Build rebalancing jobs using PostGIS distance matching with dynamic target levels.
 
 Logical steps:
-1. Read forecast results and station geometry.
+1. Read forecast results and station geography (meters-based distance).
 2. Compute dynamic target_level = 50% of station capacity (not static).
 3. Identify primary sources (FULL_SOON) and sinks (EMPTY_SOON).
-4. For each primary source, find nearest sink (EMPTY_SOON or fallback BALANCED with capacity to receive).
-5. For each primary sink, find nearest source (FULL_SOON or fallback BALANCED with surplus to give).
-6. Use PostGIS ST_Distance with MAX_DISTANCE constraint (skip pairs beyond threshold).
-7. Assign moves: move_count = min(available_to_give, needed), respecting forecasted values.
+4. For each source, pull its nearest candidate sinks (primary sinks first) from the sink set, filtered by
+   PostGIS ST_DWithin (MAX_DISTANCE constraint) and ordered by `<->` distance.
+5. Greedy allocation in Python: sources in priority order, largest surplus first, fill their candidate sinks
+   in order with move_count = min(remaining available_to_give, remaining needed).
+6. Each source gives and each sink receives at most its forecast surplus/deficit across all jobs,
+   so two sources can no longer over-fill the same sink.
 
 Configuration: uses `.env` / environment variables. No CLI args.
 
 Env vars supported:
 - `DATABASE_URL` (optional) or POSTGRES_USER/POSTGRES_PASSWORD/POSTGRES_HOST/DB_PORT/POSTGRES_DB
 - `MAX_DISTANCE_M`: max allowed distance in meters (default 5000m = 5km)
+- `MATCH_CANDIDATES`: nearest sinks considered per source (default 20)
 """
 
 import logging
 import os
 
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from dotenv import load_dotenv
 
-LOG = logging.getLogger("build_suggestions")
+from common import get_engine
 
+LOG = logging.getLogger("build_suggestions")
 
-def build_db_url_from_env():
-    user = os.environ.get('POSTGRES_USER', os.environ.get('DB_USER', 'postgres'))
-    pwd = os.environ.get('POSTGRES_PASSWORD', os.environ.get('DB_PASSWORD', 'postgres'))
-    host = os.environ.get('POSTGRES_HOST', os.environ.get('DB_HOST', 'localhost'))
-    port = os.environ.get('DB_PORT', '5432')
-    db = os.environ.get('POSTGRES_DB', os.environ.get('DB_NAME', 'baywheels'))
-    return f"postgresql://{user}:{pwd}@{host}:{port}/{db}"
+INSERT_JOBS_SQL = text(
+    "INSERT INTO rebalancing_jobs (from_station_id, to_station_id, bikes_to_move, distance_m, forecast_ts) "
+    "VALUES (:from_station_id, :to_station_id, :bikes_to_move, :distance_m, :forecast_ts)"
+)
+
+
+def assign_moves(candidates):
+    """Greedy capacity-aware allocation over (source, sink) candidate rows, taken in the given order.
+
+    Budgets are tracked across all rows, so a source can split its surplus over several sinks
+    and no sink receives more than it needs.
+    """
+    remaining_give = {}
+    remaining_need = {}
+    jobs = []
+    for c in candidates:
+        give = remaining_give.setdefault(c.from_station_id, c.available_to_give)
+        need = remaining_need.setdefault(c.to_station_id, c.needed)
+        move = min(give, need)
+        if move <= 0:
+            continue
+        remaining_give[c.from_station_id] = give - move
+        remaining_need[c.to_station_id] = need - move
+        jobs.append(dict(
+            from_station_id=c.from_station_id,
+            to_station_id=c.to_station_id,
+            bikes_to_move=move,
+            distance_m=c.distance_m,
+            forecast_ts=c.forecast_ts,
+        ))
+    return jobs
 
 
 def main():
     logging.basicConfig(level=logging.INFO)
     load_dotenv()
-    db_url = os.environ.get('DATABASE_URL') or build_db_url_from_env()
-    engine = create_engine(db_url)
+    engine = get_engine()
 
     max_distance_m = int(os.environ.get('MAX_DISTANCE_M', '5000'))
+    match_candidates = int(os.environ.get('MATCH_CANDIDATES', '20'))
 
     # SQL to compute rebalancing jobs using PostGIS distance matching with dynamic target levels
     # Step 1: Get latest forecast and join with station geometry and capacity
     # Step 2: Compute dynamic target_level = 50% of capacity per station
     # Step 3: Classify stations: primary (FULL_SOON/EMPTY_SOON) and fallback (BALANCED with surplus/deficit)
-    # Step 4: For each source, find nearest sink (primary first, then fallback) within MAX_DISTANCE
-    # Step 5: Upsert into rebalancing_jobs respecting distance and forecasted values
-    rebalancing_sql = text("""
+    # Step 4: For each source, list its nearest sinks (primary first, then fallback) within MAX_DISTANCE
+    # Step 5 (Python): allocate moves greedily with shared source/sink budgets, then insert into rebalancing_jobs
+    candidates_sql = text("""
     WITH forecast_with_geom AS (
       -- Join latest forecasts with station geometry and capacity
       SELECT
@@ -56,7 +84,7 @@ def main():
         fs.forecast_ts,
         fs.predicted_bikes_15m,
         fs.risk_status,
-        s.geom,
+        s.geog,
         si.capacity
       FROM forecast_station_status fs
       JOIN station s ON fs.station_id = s.station_id
@@ -69,7 +97,7 @@ def main():
         forecast_ts,
         predicted_bikes_15m,
         risk_status,
-        geom,
+        geog,
         capacity,
         ROUND(capacity * 0.5)::int AS target_level
       FROM forecast_with_geom
@@ -78,7 +106,7 @@ def main():
       SELECT
         station_id,
         forecast_ts,
-        geom,
+        geog,
         capacity,
         target_level,
         GREATEST(0, predicted_bikes_15m - target_level) AS available_to_give,
@@ -92,7 +120,7 @@ def main():
       SELECT
         station_id,
         forecast_ts,
-        geom,
+        geog,
         capacity,
         target_level,
         GREATEST(0, predicted_bikes_15m - target_level) AS available_to_give,
@@ -110,7 +138,7 @@ def main():
       SELECT
         station_id,
         forecast_ts,
-        geom,
+        geog,
         capacity,
         target_level,
         GREATEST(0, target_level - predicted_bikes_15m) AS needed,
@@ -124,7 +152,7 @@ def main():
       SELECT
         station_id,
         forecast_ts,
-        geom,
+        geog,
         capacity,
         target_level,
         GREATEST(0, target_level - predicted_bikes_15m) AS needed,
@@ -137,50 +165,43 @@ def main():
       SELECT * FROM sinks_primary
       UNION ALL
       SELECT * FROM sinks_fallback
-    ), source_sink_pairs AS (
-      -- For each source, find nearest sink using ST_Distance
-      -- Prioritize primary sinks first, then fallback
-      SELECT
-        src.station_id AS from_station_id,
-        snk.station_id AS to_station_id,
-        src.forecast_ts,
-        src.available_to_give,
-        snk.needed,
-        LEAST(src.available_to_give, snk.needed) AS move_count,
-        ST_Distance(src.geom, snk.geom) AS distance_m,
-        src.priority AS source_priority,
-        snk.priority AS sink_priority,
-        ROW_NUMBER() OVER (
-          PARTITION BY src.station_id
-          ORDER BY snk.priority ASC, ST_Distance(src.geom, snk.geom) ASC
-        ) AS rn
-      FROM all_sources src
-      CROSS JOIN all_sinks snk
-      WHERE ST_Distance(src.geom, snk.geom) <= :max_distance_m  -- Enforce max distance constraint
-        AND src.station_id != snk.station_id  -- Don't pair station with itself
-    ), ranked_pairs AS (
-      -- Keep only the nearest sink for each source (respecting distance constraint)
-      SELECT *
-      FROM source_sink_pairs
-      WHERE rn = 1 AND move_count > 0
     )
-    INSERT INTO rebalancing_jobs (from_station_id, to_station_id, bikes_to_move, distance_m, forecast_ts)
-    SELECT from_station_id, to_station_id, move_count, distance_m, forecast_ts
-    FROM ranked_pairs;
+    -- For each source, its MATCH_CANDIDATES nearest sinks within MAX_DISTANCE, primary sinks first.
+    -- Rows come out in allocation order: sources by priority and largest surplus, then their sinks.
+    SELECT
+      src.station_id AS from_station_id,
+      src.forecast_ts,
+      src.available_to_give,
+      snk.station_id AS to_station_id,
+      snk.needed,
+      snk.distance_m
+    FROM all_sources src
+    CROSS JOIN LATERAL (
+      SELECT
+        s.station_id,
+        s.needed,
+        s.priority,
+        ST_Distance(src.geog, s.geog) AS distance_m
+      FROM all_sinks s
+      WHERE s.station_id != src.station_id  -- Don't pair station with itself
+        AND ST_DWithin(src.geog, s.geog, :max_distance_m)  -- Enforce max distance constraint (meters)
+      ORDER BY s.priority ASC, src.geog <-> s.geog ASC
+      LIMIT :match_candidates
+    ) snk
+    ORDER BY src.priority, src.available_to_give DESC, src.station_id, snk.priority, snk.distance_m;
     """)
 
     with engine.begin() as conn:
       LOG.info("Computing rebalancing jobs (max_distance=%dm, dynamic target=50%% capacity)...", max_distance_m)
+      candidates = conn.execute(candidates_sql, dict(max_distance_m=max_distance_m, match_candidates=match_candidates))
+      jobs = assign_moves(candidates)
+
       # Replace any existing jobs with fresh computation
       conn.execute(text("TRUNCATE rebalancing_jobs"))
-      conn.execute(rebalancing_sql, dict(max_distance_m=max_distance_m))
-
-      # Log summary of created jobs
-      result = conn.execute(text(
-        "SELECT COUNT(*) as cnt, SUM(bikes_to_move) as total_bikes FROM rebalancing_jobs WHERE created_at >= NOW() - INTERVAL '1 minute'"
-      )).mappings().first()
-      if result:
-        LOG.info("Rebalancing jobs created: count=%s, total_bikes=%s", result['cnt'], result['total_bikes'])
+      if jobs:
+        conn.execute(INSERT_JOBS_SQL, jobs)
+
+      LOG.info("Rebalancing jobs created: count=%d, total_bikes=%d", len(jobs), sum(j['bikes_to_move'] for j in jobs))
 
 
 if __name__ == '__main__':
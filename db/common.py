@@ -0,0 +1,35 @@
+"""Shared database configuration for the `db/` scripts.
+
+Scripts run as `python db/<script>.py`, so `db/` is on `sys.path` and this module imports as `common`.
+Call `load_dotenv()` before the first `db_url()` / `get_engine()` call: both are cached for the process.
+
+Env vars supported:
+- `DATABASE_URL` (optional) or POSTGRES_USER/POSTGRES_PASSWORD/POSTGRES_HOST/DB_PORT/POSTGRES_DB
+- `DB_POOL_SIZE`: connections kept by the shared engine (default 5)
+"""
+
+import os
+from functools import lru_cache
+
+from sqlalchemy import create_engine
+
+
+@lru_cache(maxsize=1)
+def db_url():
+    """Return `DATABASE_URL`, or a URL built from the individual POSTGRES_* / DB_* variables."""
+    url = os.environ.get('DATABASE_URL')
+    if url:
+        return url
+    user = os.environ.get('POSTGRES_USER', os.environ.get('DB_USER', 'postgres'))
+    pwd = os.environ.get('POSTGRES_PASSWORD', os.environ.get('DB_PASSWORD', 'postgres'))
+    host = os.environ.get('POSTGRES_HOST', os.environ.get('DB_HOST', 'localhost'))
+    port = os.environ.get('DB_PORT', '5432')
+    db = os.environ.get('POSTGRES_DB', os.environ.get('DB_NAME', 'baywheels'))
+    return f"postgresql://{user}:{pwd}@{host}:{port}/{db}"
+
+
+@lru_cache(maxsize=1)
+def get_engine():
+    """Process-wide engine, so scripts run in the same process (e.g. from a scheduler) share one pool."""
+    pool_size = int(os.environ.get('DB_POOL_SIZE', '5'))
+    return create_engine(db_url(), pool_pre_ping=True, pool_size=pool_size)
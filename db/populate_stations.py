@@ -14,19 +14,12 @@ import csv
 import logging
 import os
 
-from sqlalchemy import create_engine, text
 from dotenv import load_dotenv
 
-LOG = logging.getLogger("populate_stations")
-
+from common import get_engine
+from load_trips import upsert_stations as copy_upsert_stations
 
-def build_db_url_from_env():
-    user = os.environ.get('POSTGRES_USER', os.environ.get('DB_USER', 'postgres'))
-    pwd = os.environ.get('POSTGRES_PASSWORD', os.environ.get('DB_PASSWORD', 'postgres'))
-    host = os.environ.get('POSTGRES_HOST', os.environ.get('DB_HOST', 'localhost'))
-    port = os.environ.get('DB_PORT', '5432')
-    db = os.environ.get('POSTGRES_DB', os.environ.get('DB_NAME', 'baywheels'))
-    return f"postgresql://{user}:{pwd}@{host}:{port}/{db}"
+LOG = logging.getLogger("populate_stations")
 
 
 def get_cell(row, fieldnames, *names):
@@ -97,30 +90,24 @@ def extract_stations_from_csv(filepath):
 
 
 def upsert_stations(conn, stations):
-    """Upsert station list into the station table."""
+    """Upsert station list into the station table via load_trips' COPY into station_stage."""
     if not stations:
         LOG.warning("No stations to upsert")
         return
-    # Use PostGIS geometry for station location
-    stmt = text(
-        "INSERT INTO station (station_id, station_name, geom) VALUES (:station_id, :station_name, ST_SetSRID(ST_MakePoint(:station_lng, :station_lat), 4326)) "
-        "ON CONFLICT (station_id) DO UPDATE SET station_name = EXCLUDED.station_name, geom = COALESCE(EXCLUDED.geom, station.geom)"
-    )
 
-    records = []
-    for sid, (sname, slat, slng) in stations.items():
-        records.append(dict(station_id=sid, station_name=sname, station_lat=slat, station_lng=slng))
-    conn.execute(stmt, records)
-    LOG.info("Upserted %d station(s)", len(records))
+    cur = conn.connection.cursor()
+    try:
+        copy_upsert_stations(cur, stations)
+    finally:
+        cur.close()
+    LOG.info("Upserted %d station(s)", len(stations))
 
 
 def main():
     logging.basicConfig(level=logging.INFO)
     load_dotenv()
     
-    # Build DB URL from env
-    db_url = os.environ.get('DATABASE_URL') or build_db_url_from_env()
-    engine = create_engine(db_url)
+    engine = get_engine()
     
     # Get CSV path from env (default to sample.csv)
     csv_path = os.environ.get('STATION_CSV_PATH', 'db/data/202509-baywheels-tripdata.csv')
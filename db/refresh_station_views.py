@@ -0,0 +1,48 @@
+"""Refresh the materialized read models served by the backend API.
+
+The backend creates these views (`backend/app/db/views.py`) and refreshes them every
+`STATION_VIEWS_REFRESH_INTERVAL` seconds. Run this after a GBFS status batch is written to `station_status`
+to publish it immediately, e.g. at the end of the poller loop.
+
+Configuration: uses `.env` or environment variables. No CLI args.
+
+Env vars supported:
+- `DATABASE_URL` (optional) or POSTGRES_USER/POSTGRES_PASSWORD/POSTGRES_HOST/DB_PORT/POSTGRES_DB
+"""
+
+import logging
+
+from sqlalchemy import text
+from dotenv import load_dotenv
+
+from common import get_engine
+
+LOG = logging.getLogger("refresh_station_views")
+
+# Refresh order matters: later views may read from earlier ones
+STATION_VIEWS = (
+    "station_status_latest",
+    "station_suggestions_cards",
+)
+
+
+def refresh_station_views(conn):
+    """Refresh all station read models without blocking concurrent readers."""
+    for view in STATION_VIEWS:
+        conn.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}"))
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+
+    engine = get_engine()
+
+    with engine.begin() as conn:
+        LOG.info("Refreshing station views: %s", ", ".join(STATION_VIEWS))
+        refresh_station_views(conn)
+        LOG.info("Station views refreshed")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,12 +2,16 @@
 
 Logical steps:
 1. Read current station state from station_inventory (bikes available, capacity, timestamp).
-2. Convert each station's last_reported timestamp into a 15-min bucket: day_of_week, hour_of_day, quarter_hour.
-3. Lookup expected net flow from station_15min_demand using the bucket (exact match → fallback chain).
+2. Read each station's 15-min bucket of last_reported (generated `bucket_id` column): day_of_week, hour_of_day, quarter_hour.
+3. Lookup expected net flow from station_15min_demand using the bucket (exact match → fallback chain
+   over the mv_demand_* tiers maintained by build_station_flow_15min.py).
 4. Predict 15-minute future bike count: predicted_bikes = current_bikes + expected_net_flow.
 5. Clamp to [0, capacity].
 6. Categorize station: EMPTY_SOON / FULL_SOON / BALANCED.
-7. Write results to forecast_station_status.
+7. Write results to forecast_station_status from a staging table. By default only stations whose inputs
+   changed since their stored forecast are recomputed and replaced: report (last_reported/bucket_id),
+   current_bikes, capacity, EMPTY_THRESHOLD/FULL_MARGIN, or the demand_version bumped by
+   build_station_flow_15min.py. A full refresh TRUNCATEs and rewrites all.
 
 Configuration: uses `.env` or environment variables. No CLI args.
 
@@ -15,115 +19,191 @@ Env vars supported:
 - `DATABASE_URL` (optional) or POSTGRES_USER/POSTGRES_PASSWORD/POSTGRES_HOST/DB_PORT/POSTGRES_DB
 - `EMPTY_THRESHOLD`: bikes at or below this → EMPTY_SOON (default 2)
 - `FULL_MARGIN`: capacity - FULL_MARGIN → FULL_SOON (default 3)
+- `FORECAST_FULL_REFRESH`: set to 1 to recompute every station regardless of its stored inputs
+  (default 0: incremental)
+- `FORECAST_JIT`: set to 1 to force Postgres JIT compilation of the forecast query (default 0: server
+  settings). Only pays off for large station counts; compilation costs more than a few hundred rows take.
 """
 
 import logging
 import os
 from datetime import datetime
 
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from dotenv import load_dotenv
 
+from common import get_engine
+
 LOG = logging.getLogger("run_forecast")
 
+# forecast_station_status columns: the prediction plus the inputs it was computed from (the incremental skip key)
+FORECAST_COLUMNS = (
+    "station_id, forecast_ts, predicted_bikes_15m, risk_status, "
+    "last_bucket_id, last_current_bikes, last_capacity, demand_version, empty_threshold, full_margin"
+)
 
-def build_db_url_from_env():
-    user = os.environ.get('POSTGRES_USER', os.environ.get('DB_USER', 'postgres'))
-    pwd = os.environ.get('POSTGRES_PASSWORD', os.environ.get('DB_PASSWORD', 'postgres'))
-    host = os.environ.get('POSTGRES_HOST', os.environ.get('DB_HOST', 'localhost'))
-    port = os.environ.get('DB_PORT', '5432')
-    db = os.environ.get('POSTGRES_DB', os.environ.get('DB_NAME', 'baywheels'))
-    return f"postgresql://{user}:{pwd}@{host}:{port}/{db}"
+# Compile the forecast's per-row expressions (ROUND/GREATEST/LEAST/CASE) and aggregates to native code
+# regardless of the planner's cost estimate; SET LOCAL keeps it to the forecast transaction
+JIT_SESSION_SQL = (
+    "SET LOCAL jit = on",
+    "SET LOCAL jit_above_cost = 0",
+    "SET LOCAL jit_inline_above_cost = 0",
+    "SET LOCAL jit_optimize_above_cost = 0",
+)
 
 
 def main():
     logging.basicConfig(level=logging.INFO)
     load_dotenv()
 
-    db_url = os.environ.get('DATABASE_URL') or build_db_url_from_env()
-    engine = create_engine(db_url)
+    engine = get_engine()
 
     empty_threshold = int(os.environ.get('EMPTY_THRESHOLD', '2'))
     full_margin = int(os.environ.get('FULL_MARGIN', '3'))
+    full_refresh = os.environ.get('FORECAST_FULL_REFRESH', '0').lower() in ('1', 'true', 'yes')
+    use_jit = os.environ.get('FORECAST_JIT', '0').lower() in ('1', 'true', 'yes')
 
     # SQL to:
-    # 1. Read current inventory (bikes, capacity, last_reported timestamp)
-    # 2. Convert timestamp to bucket (day_of_week, hour_of_day, quarter_hour)
+    # 1. Read current inventory (bikes, capacity, last_reported timestamp) for stations whose stored forecast
+    #    was computed from different inputs (all stations on a full refresh)
+    # 2. Unpack the generated bucket_id into (day_of_week, hour_of_day, quarter_hour)
     # 3. Lookup expected_net_flow from station_15min_demand with fallback chain:
     #    - Exact bucket match → same hour/day_of_week → same hour only → station average → 0
     # 4. Predict bikes and categorize
-    # 5. Upsert into forecast_station_status
+    # 5. Stage into forecast_new; main() then swaps it into forecast_station_status
     forecast_sql = text("""
-    WITH current_state AS (
-      -- Read current inventory and compute bucket from last_reported
+    WITH demand AS (
+      -- Version of station_15min_demand / mv_demand_*, bumped by build_station_flow_15min.py on every rebuild
+      SELECT COALESCE((SELECT version FROM demand_version), 0) AS demand_version
+    ), current_state AS (
+      -- Read current inventory and its precomputed bucket of last_reported
       SELECT
         si.station_id,
         si.current_bikes,
         si.capacity,
         si.last_reported,
-        EXTRACT(dow FROM si.last_reported)::int AS day_of_week,
-        EXTRACT(hour FROM si.last_reported)::int AS hour_of_day,
-        (EXTRACT(minute FROM si.last_reported)::int) / 15 AS quarter_hour
+        si.bucket_id,
+        d.demand_version,
+        -- Unpack the generated bucket_id (dow*96 + hour*4 + quarter) for the coarser tiers
+        si.bucket_id / 96 AS day_of_week,
+        (si.bucket_id % 96) / 4 AS hour_of_day,
+        si.bucket_id % 4 AS quarter_hour
       FROM station_inventory si
+      CROSS JOIN demand d
+      -- Anti-join: skip stations whose stored forecast was computed from exactly these inputs
+      -- (report, inventory, demand version and thresholds); any change recomputes the station
+      WHERE :full_refresh
+         OR NOT EXISTS (
+           SELECT 1 FROM forecast_station_status f
+           WHERE f.station_id = si.station_id
+             AND f.forecast_ts = si.last_reported
+             AND f.last_bucket_id = si.bucket_id
+             AND f.last_current_bikes = si.current_bikes
+             AND f.last_capacity = si.capacity
+             AND f.demand_version = d.demand_version
+             AND f.empty_threshold = :empty_threshold
+             AND f.full_margin = :full_margin
+         )
     ), demand_lookup AS (
-      -- Lookup expected net flow with fallback chain
+      -- Lookup expected net flow with fallback chain; each tier is one indexed key lookup
       SELECT
         cs.station_id,
         cs.current_bikes,
         cs.capacity,
         cs.last_reported,
+        cs.bucket_id,
+        cs.demand_version,
+        -- Tiers in priority order; COALESCE evaluates each scalar subquery only when
+        -- every earlier tier returned NULL, so later lookups never execute once one matches
         COALESCE(
-          -- Exact match: day_of_week, hour_of_day, quarter_hour
-          (SELECT avg_net_flow_15m FROM station_15min_demand d
-           WHERE d.station_id = cs.station_id
-           AND d.day_of_week = cs.day_of_week
-           AND d.hour_of_day = cs.hour_of_day
-           AND d.quarter_hour = cs.quarter_hour
-           LIMIT 1),
-          -- Fallback 1: same day/hour, any quarter
-          (SELECT AVG(avg_net_flow_15m) FROM station_15min_demand d
-           WHERE d.station_id = cs.station_id
-           AND d.day_of_week = cs.day_of_week
-           AND d.hour_of_day = cs.hour_of_day
-           LIMIT 1),
-          -- Fallback 2: any day, same hour/quarter
-          (SELECT AVG(avg_net_flow_15m) FROM station_15min_demand d
-           WHERE d.station_id = cs.station_id
-           AND d.hour_of_day = cs.hour_of_day
-           AND d.quarter_hour = cs.quarter_hour
-           LIMIT 1),
-          -- Fallback 3: station-level average across all buckets
-          (SELECT AVG(avg_net_flow_15m) FROM station_15min_demand d
-           WHERE d.station_id = cs.station_id
-           LIMIT 1),
-          -- Fallback 4: no historical data, assume 0
-          0.0
+          (SELECT de.avg_net_flow_15m
+           FROM station_15min_demand de  -- Exact match: day_of_week, hour_of_day, quarter_hour
+           WHERE de.station_id = cs.station_id
+             AND de.bucket_id = cs.bucket_id),
+          (SELECT ddh.avg_net_flow_15m
+           FROM mv_demand_dh ddh  -- Fallback 1: same day/hour, any quarter
+           WHERE ddh.station_id = cs.station_id
+             AND ddh.day_of_week = cs.day_of_week
+             AND ddh.hour_of_day = cs.hour_of_day),
+          (SELECT dhq.avg_net_flow_15m
+           FROM mv_demand_hq dhq  -- Fallback 2: any day, same hour/quarter
+           WHERE dhq.station_id = cs.station_id
+             AND dhq.hour_of_day = cs.hour_of_day
+             AND dhq.quarter_hour = cs.quarter_hour),
+          (SELECT ds.avg_net_flow_15m
+           FROM mv_demand_stn ds  -- Fallback 3: station-level average across all buckets
+           WHERE ds.station_id = cs.station_id),
+          0.0  -- Fallback 4: no historical data, assume 0
         )::numeric AS expected_net_flow
       FROM current_state cs
+    ), rounded AS (
+      -- Round the raw prediction once per station; clamping and categorizing reuse the integer
+      SELECT
+        station_id,
+        current_bikes,
+        capacity,
+        last_reported,
+        bucket_id,
+        demand_version,
+        ROUND(current_bikes + expected_net_flow)::int AS rounded_bikes
+      FROM demand_lookup
     ), predictions AS (
       -- Compute predicted bikes and categorize
       SELECT
         station_id,
         last_reported AS forecast_ts,
-        GREATEST(0, LEAST(capacity, ROUND(current_bikes + expected_net_flow)::int)) AS predicted_bikes,
+        bucket_id AS last_bucket_id,
+        current_bikes AS last_current_bikes,
+        capacity AS last_capacity,
+        demand_version,
+        GREATEST(0, LEAST(capacity, rounded_bikes)) AS predicted_bikes,
         CASE
-          WHEN ROUND(current_bikes + expected_net_flow)::int <= :empty_threshold THEN 'empty_soon'::forecast_risk_status
-          WHEN ROUND(current_bikes + expected_net_flow)::int >= (capacity - :full_margin) THEN 'full_soon'::forecast_risk_status
+          WHEN rounded_bikes <= :empty_threshold THEN 'empty_soon'::forecast_risk_status
+          WHEN rounded_bikes >= (capacity - :full_margin) THEN 'full_soon'::forecast_risk_status
           ELSE 'balanced'::forecast_risk_status
         END AS risk_status
-      FROM demand_lookup
+      FROM rounded
+    )
+    INSERT INTO forecast_new (
+      station_id, forecast_ts, predicted_bikes_15m, risk_status,
+      last_bucket_id, last_current_bikes, last_capacity, demand_version, empty_threshold, full_margin
     )
-    INSERT INTO forecast_station_status (station_id, forecast_ts, predicted_bikes_15m, risk_status)
-    SELECT station_id, forecast_ts, predicted_bikes, risk_status FROM predictions
-    ON CONFLICT (station_id, forecast_ts) DO UPDATE
-      SET predicted_bikes_15m = EXCLUDED.predicted_bikes_15m,
-          risk_status = EXCLUDED.risk_status;
+    SELECT
+      station_id, forecast_ts, predicted_bikes, risk_status,
+      last_bucket_id, last_current_bikes, last_capacity, demand_version, :empty_threshold, :full_margin
+    FROM predictions;
     """)
 
     with engine.begin() as conn:
-        LOG.info("Running forecast (empty_threshold=%d, full_margin=%d)...", empty_threshold, full_margin)
-        conn.execute(forecast_sql, dict(empty_threshold=empty_threshold, full_margin=full_margin))
-        LOG.info("Forecasts written to forecast_station_status")
+        LOG.info(
+            "Running %s forecast (empty_threshold=%d, full_margin=%d)...",
+            "full" if full_refresh else "incremental", empty_threshold, full_margin,
+        )
+        if use_jit:
+            for stmt in JIT_SESSION_SQL:
+                conn.execute(text(stmt))
+        # Compute into a staging table first so locks on forecast_station_status are held only for the copy
+        conn.execute(text(
+            "CREATE TEMP TABLE forecast_new (LIKE forecast_station_status INCLUDING DEFAULTS) ON COMMIT DROP"
+        ))
+        staged = conn.execute(
+            forecast_sql,
+            dict(empty_threshold=empty_threshold, full_margin=full_margin, full_refresh=full_refresh),
+        ).rowcount
+        if full_refresh:
+            # Replace the previous forecast wholesale (no per-row conflict checks or dead tuples)
+            conn.execute(text("TRUNCATE forecast_station_status"))
+        else:
+            # Drop the rows being replaced, plus forecasts for stations no longer in station_inventory
+            conn.execute(text(
+                "DELETE FROM forecast_station_status f "
+                "WHERE f.station_id IN (SELECT station_id FROM forecast_new) "
+                "OR NOT EXISTS (SELECT 1 FROM station_inventory si WHERE si.station_id = f.station_id)"
+            ))
+        conn.execute(text(
+            f"INSERT INTO forecast_station_status ({FORECAST_COLUMNS}) SELECT {FORECAST_COLUMNS} FROM forecast_new"
+        ))
+        LOG.info("Forecasts written to forecast_station_status (%d station(s) recomputed)", staged)
 
 
 if __name__ == '__main__':
@@ -5,8 +5,8 @@
 -- ============================================================================
 -- 1. SPATIAL INDEXES (PostGIS)
 -- ============================================================================
--- Used by: build_suggestions.py (ST_Distance for nearest-neighbor queries)
--- Benefit: fast KNN queries and distance calculations
+-- For ad-hoc spatial queries on station.geom. build_suggestions.py does not use a spatial index: its
+-- ST_DWithin / <-> candidate lookup runs over the all_sinks CTE (one row per at-risk or balanced station)
 
 CREATE INDEX IF NOT EXISTS idx_station_geom_gist 
     ON station USING GIST (geom);
@@ -46,6 +46,10 @@ CREATE INDEX IF NOT EXISTS idx_trip_ended_at
 CREATE INDEX IF NOT EXISTS idx_station_15min_demand_station_bucket
     ON station_15min_demand (station_id, day_of_week, hour_of_day, quarter_hour);
 
+-- Packed bucket lookup: run_forecast.py joins station_inventory.bucket_id on this for the exact match
+CREATE UNIQUE INDEX IF NOT EXISTS idx_station_15min_demand_station_bucket_id
+    ON station_15min_demand (station_id, bucket_id);
+
 -- Partial index: high-traffic stations (if needed for very large deployments)
 -- Helps forecast queries on busy stations
 CREATE INDEX IF NOT EXISTS idx_station_15min_demand_station_only
@@ -69,6 +73,15 @@ CREATE INDEX IF NOT EXISTS idx_forecast_station_status_risk_status
 CREATE INDEX IF NOT EXISTS idx_forecast_station_status_station_risk
     ON forecast_station_status (station_id, risk_status);
 
+-- Latest forecast batch: build_suggestions.py's (SELECT MAX(forecast_ts)) becomes a single index tuple read,
+-- and the forecast_ts = MAX(...) filter an index-only scan over the INCLUDEd columns
+CREATE INDEX IF NOT EXISTS idx_forecast_station_status_latest
+    ON forecast_station_status (forecast_ts DESC) INCLUDE (station_id, predicted_bikes_15m, risk_status);
+
+-- Partial: only at-risk stations (FULL_SOON / EMPTY_SOON), the primary sources/sinks for rebalancing
+CREATE INDEX IF NOT EXISTS idx_forecast_station_status_risky
+    ON forecast_station_status (risk_status, station_id) WHERE risk_status <> 'balanced';
+
 -- ============================================================================
 -- 5. REBALANCING_JOBS INDEXES
 -- ============================================================================
@@ -112,7 +125,7 @@ CREATE INDEX IF NOT EXISTS idx_suggestion_candidates_created_at
 --
 -- Index Strategy:
 -- - Composite indexes on (station_id, timestamp/bucket) are used heavily in aggregation.
--- - Spatial GiST index on station.geom accelerates ST_Distance queries.
+-- - The GiST index on station.geom serves spatial queries filtering station itself (not build_suggestions.py).
 -- - Risk status + station indexes speed up forecasting logic filters.
 --
 -- Maintenance:
@@ -21,6 +21,9 @@ ALTER TABLE station
     DROP COLUMN IF EXISTS station_lat,
     DROP COLUMN IF EXISTS station_lng,
     ADD COLUMN IF NOT EXISTS geom geometry(POINT,4326);
+-- Geography copy of geom so distance filters work in meters on the spheroid; kept in sync by Postgres
+ALTER TABLE station
+    ADD COLUMN IF NOT EXISTS geog geography(POINT,4326) GENERATED ALWAYS AS (geom::geography) STORED;
 
 -- Placeholder for current inventory (optional). Team C can populate live snapshots here.
 CREATE TABLE IF NOT EXISTS station_inventory (
@@ -29,6 +32,13 @@ CREATE TABLE IF NOT EXISTS station_inventory (
     capacity INT DEFAULT 20,
     last_reported TIMESTAMP WITHOUT TIME ZONE DEFAULT now()
 );
+-- 15-min week bucket of last_reported packed as day_of_week*96 + hour_of_day*4 + quarter_hour (0..671)
+ALTER TABLE station_inventory
+    ADD COLUMN IF NOT EXISTS bucket_id SMALLINT GENERATED ALWAYS AS (
+        (EXTRACT(dow FROM last_reported)::int * 96
+         + EXTRACT(hour FROM last_reported)::int * 4
+         + EXTRACT(minute FROM last_reported)::int / 15)::smallint
+    ) STORED;
 
 -- Historical trips (from CSV ingestion)
 CREATE TABLE IF NOT EXISTS trip_history (
@@ -62,6 +72,44 @@ CREATE TABLE IF NOT EXISTS station_15min_demand (
     avg_net_flow_15m NUMERIC NOT NULL DEFAULT 0,
     PRIMARY KEY (station_id, day_of_week, hour_of_day, quarter_hour)
 );
+-- Same packed bucket as station_inventory.bucket_id, so the exact-bucket lookup is one integer equality
+ALTER TABLE station_15min_demand
+    ADD COLUMN IF NOT EXISTS bucket_id SMALLINT GENERATED ALWAYS AS (
+        (day_of_week * 96 + hour_of_day * 4 + quarter_hour)::smallint
+    ) STORED;
+
+-- Version of the demand data, bumped by `build_station_flow_15min.py` in the same transaction that rewrites
+-- station_15min_demand and the mv_demand_* tiers. run_forecast.py stores it with each forecast and
+-- recomputes stations forecast from an older version.
+CREATE TABLE IF NOT EXISTS demand_version (
+    singleton BOOLEAN PRIMARY KEY DEFAULT true CHECK (singleton),
+    version BIGINT NOT NULL DEFAULT 0,
+    built_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now()
+);
+
+-- Coarser demand tiers used as forecast fallbacks when the exact bucket has no history.
+-- Refreshed by `build_station_flow_15min.py` right after it rewrites station_15min_demand.
+-- Unique indexes double as the forecast lookup keys and allow REFRESH ... CONCURRENTLY.
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_demand_dh AS  -- same day/hour, any quarter
+SELECT station_id, day_of_week, hour_of_day, AVG(avg_net_flow_15m) AS avg_net_flow_15m
+FROM station_15min_demand
+GROUP BY station_id, day_of_week, hour_of_day;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_demand_dh_key
+    ON mv_demand_dh (station_id, day_of_week, hour_of_day);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_demand_hq AS  -- any day, same hour/quarter
+SELECT station_id, hour_of_day, quarter_hour, AVG(avg_net_flow_15m) AS avg_net_flow_15m
+FROM station_15min_demand
+GROUP BY station_id, hour_of_day, quarter_hour;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_demand_hq_key
+    ON mv_demand_hq (station_id, hour_of_day, quarter_hour);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_demand_stn AS  -- station-level average across all buckets
+SELECT station_id, AVG(avg_net_flow_15m) AS avg_net_flow_15m
+FROM station_15min_demand
+GROUP BY station_id;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_demand_stn_key
+    ON mv_demand_stn (station_id);
 
 -- Forecast table: predicted bikes for a station for a future bucket
 CREATE TABLE IF NOT EXISTS forecast_station_status (
@@ -71,6 +119,16 @@ CREATE TABLE IF NOT EXISTS forecast_station_status (
     risk_status forecast_risk_status NOT NULL,
     PRIMARY KEY (station_id, forecast_ts)
 );
+-- Inputs the forecast was computed from; run_forecast.py skips a station only while its station_inventory
+-- row (last_reported, bucket_id, current_bikes, capacity), the demand_version and the thresholds all
+-- still match these
+ALTER TABLE forecast_station_status
+    ADD COLUMN IF NOT EXISTS last_bucket_id SMALLINT,
+    ADD COLUMN IF NOT EXISTS last_current_bikes INT,
+    ADD COLUMN IF NOT EXISTS last_capacity INT,
+    ADD COLUMN IF NOT EXISTS demand_version BIGINT,
+    ADD COLUMN IF NOT EXISTS empty_threshold INT,
+    ADD COLUMN IF NOT EXISTS full_margin INT;
 
 -- Suggestion candidates: simple moves proposed by forecasting logic
 CREATE TABLE IF NOT EXISTS suggestion_candidates (
@@ -96,7 +154,8 @@ CREATE TABLE IF NOT EXISTS rebalancing_jobs (
 
 -- Notes:
 -- - `station_inventory` is populated by live GBFS poller; includes capacity and timestamp.
--- - `station_15min_demand` is computed by `build_station_flow_15min.py` and stores historical patterns.
+-- - `station_15min_demand` is computed by `build_station_flow_15min.py` and stores historical patterns;
+--   its fallback tiers (`mv_demand_dh`, `mv_demand_hq`, `mv_demand_stn`) are refreshed by the same script.
 -- - `rebalancing_jobs` is computed by `build_suggestions.py` and drives actual rebalancing operations.
 --
 -- For comprehensive indexes (spatial, composite, partial), see: db/sql/indexes.sql